@@ -0,0 +1,14 @@
+from functools import lru_cache
+import openai
+
+@lru_cache(maxsize=1)
+def get_client() -> openai.AsyncOpenAI:
+    """Returns one AsyncOpenAI client per process, so every example reuses the same connection pool."""
+    # The SDK's default pool already keeps up to 100 connections alive; only the timeouts are tightened
+    return openai.AsyncOpenAI(timeout=openai.Timeout(60.0, connect=5.0))
+
+async def close_client():
+    """Closes the shared client's connection pool; the next get_client() call starts a fresh one."""
+    if get_client.cache_info().currsize:
+        await get_client().close()
+        get_client.cache_clear()
@@ -1,12 +1,21 @@
+import asyncio
+import json
 import os
-from datetime import datetime
+import time
+import weakref
 from typing import List, Optional
 from enum import Enum
 from pydantic import BaseModel, Field
-import openai
 from dotenv import load_dotenv
 from fsm_llm.fsm import LLMStateMachine
+from fsm_llm.llm_handler import LLMUtilities
 from fsm_llm.state_models import FSMRun, DefaultResponse, ImmediateStateChange
+from _shared import get_client
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard library works too
+    orjson = None
 
 # Load environment variables
 load_dotenv()
@@ -17,6 +26,15 @@ LIGHT_BLUE = "\033[94m"
 ORANGE = "\033[38;5;208m"
 RESET = "\033[0m"
 
+# Model used for the FSM turns and the parallel analyses
+LLM_MODEL = "gpt-4o-mini"
+
+def serialize_audit_log(audit_log: dict) -> bytes:
+    """Serializes the audit log for storage, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(audit_log)
+    return json.dumps(audit_log).encode("utf-8")
+
 class Severity(str, Enum):
     LOW = "low"
     MODERATE = "moderate"
@@ -59,6 +77,9 @@ class SymptomAssessment(BaseModel):
     potential_causes: List[str]
     risk_factors: List[str]
     additional_questions: List[str]
+    requires_emergency_care: bool = Field(
+        description="True if the symptoms suggest a serious condition that needs immediate medical attention"
+    )
 
 class TreatmentPlan(BaseModel):
     primary_recommendations: List[str]
@@ -143,7 +164,7 @@ async def emergency_handler(
     """,
     response_model=PatientInfo,
     transitions={
-        "SYMPTOM_ASSESSMENT": "When patient info is complete",
+        "PARALLEL_ANALYSIS": "When patient info is complete",
         "EMERGENCY": "If any red flags are detected in patient history",
     }
 )
@@ -160,9 +181,7 @@ async def gather_patient_info(
         "including when they started and how severe they are."
     )
 
-@fsm.define_state(
-    state_key="SYMPTOM_ASSESSMENT",
-    prompt_template="""
+SYMPTOM_ASSESSMENT_PROMPT = """
     Analyze the reported symptoms considering:
     - Patient's age, gender, and medical history
     - Symptom severity and duration
@@ -170,76 +189,125 @@ async def gather_patient_info(
     - Risk factors and warning signs
     
     Generate a structured assessment and identify any patterns or concerning combinations.
-    """,
-    response_model=SymptomAssessment,
-    transitions={
-        "DRUG_INTERACTION_CHECK": "If symptoms are well understood and non-emergency",
-        "EMERGENCY": "If symptoms suggest a serious condition",
-    }
-)
-async def assess_symptoms(
-    fsm: LLMStateMachine,
-    response: SymptomAssessment,
-    will_transition: bool
-) -> str:
-    fsm.set_context_data("symptom_assessment", response.model_dump())
-    
-    # Check for high-severity symptoms
-    if any(s.severity == Severity.CRITICAL for s in response.symptoms):
-        return ImmediateStateChange(
-            next_state="EMERGENCY",
-            input="Critical symptoms detected"
-        )
-    
-    assessment = "Symptom Assessment:\n"
-    for symptom in response.symptoms:
-        assessment += f"- {symptom.name} ({symptom.severity}): {symptom.description}\n"
+    Flag the assessment as requiring emergency care if the symptoms suggest a serious condition.
+    Only ask additional questions if the answers are needed to complete the assessment.
+    """
+
+DRUG_INTERACTION_PROMPT = """
+    Analyze the patient's current medications for potential interactions.
+    Consider both existing conditions and reported symptoms.
+    Flag any concerning combinations or contraindications.
+    """
+
+async def run_analysis(prompt: str, response_model: type, patient_context: str):
+    """Runs one structured analysis directly against the LLM, outside the FSM turn."""
+    return await LLMUtilities.get_parsed_completion(
+        get_client(),
+        [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": patient_context},
+        ],
+        response_model,
+        LLM_MODEL,
+    )
+
+def record_reported_symptoms(user_input: str, fsm: LLMStateMachine) -> str:
+    """Keeps the raw symptom description for the parallel analyses, adding answers to follow-up questions."""
+    reported = fsm.get_context_data("reported_symptoms")
+    fsm.set_context_data("reported_symptoms", f"{reported}\n{user_input}" if reported else user_input)
+    return user_input
+
+def format_symptom_assessment(response: SymptomAssessment) -> str:
+    parts = ["Symptom Assessment:"]
+    parts.extend(
+        f"- {symptom.name} ({symptom.severity}): {symptom.description}"
+        for symptom in response.symptoms
+    )
     
-    assessment += "\nPotential Causes:\n"
-    for cause in response.potential_causes:
-        assessment += f"- {cause}\n"
+    parts.extend(("", "Potential Causes:"))
+    parts.extend(f"- {cause}" for cause in response.potential_causes)
     
     if response.additional_questions:
-        assessment += "\nI need some additional information:\n"
-        for question in response.additional_questions:
-            assessment += f"- {question}\n"
+        parts.extend(("", "I need some additional information:"))
+        parts.extend(f"- {question}" for question in response.additional_questions)
     
-    return assessment
+    return "\n".join(parts) + "\n"
+
+def format_drug_interactions(response: DrugInteraction) -> str:
+    return (
+        f"Medication Analysis:\n"
+        f"Severity: {response.severity}\n"
+        f"Details: {response.description}\n"
+        f"Recommendation: {response.recommendation}\n\n"
+    )
 
 @fsm.define_state(
-    state_key="DRUG_INTERACTION_CHECK",
-    prompt_template="""
-    Analyze the patient's current medications for potential interactions.
-    Consider both existing conditions and reported symptoms.
-    Flag any concerning combinations or contraindications.
-    """,
-    response_model=DrugInteraction,
-    transitions={
-        "GENERATE_PLAN": "If no severe interactions are found",
-        "EMERGENCY": "If dangerous drug interactions are detected",
-    }
+    state_key="PARALLEL_ANALYSIS",
+    response_model=DefaultResponse,
+    # The analyses below are the real work, so skip the FSM's own LLM call
+    static_response="Analyzing your symptoms and medications.",
+    transitions={"GENERATE_PLAN": "Once the symptoms have been described"},
+    preprocess_input=record_reported_symptoms,
 )
-async def check_drug_interactions(
+async def parallel_analysis(
     fsm: LLMStateMachine,
-    response: DrugInteraction,
+    response: DefaultResponse,
     will_transition: bool
 ) -> str:
-    fsm.set_context_data("drug_interactions", response.model_dump())
+    # Symptom assessment and drug interaction check only depend on the
+    # patient info and the reported symptoms, so run them concurrently
+    patient_context = (
+        f"Patient information:\n{json.dumps(fsm.get_context_data('patient_info'))}\n\n"
+        f"Reported symptoms:\n{fsm.get_context_data('reported_symptoms')}"
+    )
+    symptom_assessment, drug_interactions = await asyncio.gather(
+        run_analysis(SYMPTOM_ASSESSMENT_PROMPT, SymptomAssessment, patient_context),
+        run_analysis(DRUG_INTERACTION_PROMPT, DrugInteraction, patient_context),
+    )
+    fsm.set_context_data("symptom_assessment", symptom_assessment.model_dump())
+    fsm.set_context_data("drug_interactions", drug_interactions.model_dump())
     
-    if response.severity == Severity.CRITICAL:
+    # Check both results for emergencies before moving on
+    if symptom_assessment.requires_emergency_care or any(
+        s.severity == Severity.CRITICAL for s in symptom_assessment.symptoms
+    ):
         return ImmediateStateChange(
             next_state="EMERGENCY",
-            input=f"Critical drug interaction detected: {response.description}"
+            input="Symptoms suggest a serious condition"
+        )
+    if drug_interactions.severity == Severity.CRITICAL:
+        return ImmediateStateChange(
+            next_state="EMERGENCY",
+            input=f"Critical drug interaction detected: {drug_interactions.description}"
         )
     
-    interaction_msg = (
-        f"Medication Analysis:\n"
-        f"Severity: {response.severity}\n"
-        f"Details: {response.description}\n"
-        f"Recommendation: {response.recommendation}\n\n"
-    )
-    
-    return interaction_msg + "Now, let's generate your treatment plan."
+    analysis = format_symptom_assessment(symptom_assessment) + "\n" + format_drug_interactions(drug_interactions)
+
+    # Stay in this state until the follow-up questions are answered, then re-run the analyses
+    if symptom_assessment.additional_questions:
+        return analysis + "Please answer the questions above so I can complete the assessment."
+
+    fsm.set_next_state("GENERATE_PLAN")
+    return analysis + "Now, let's generate your treatment plan."
+
+# Recommendations already previewed during the current GENERATE_PLAN turn, per session
+_PREVIEW_SHOWN = weakref.WeakKeyDictionary()
+
+def start_recommendation_preview(user_input: str, fsm: LLMStateMachine) -> str:
+    """Resets the preview before the plan is requested, so every turn starts from the first recommendation."""
+    _PREVIEW_SHOWN[fsm] = 0
+    return user_input
+
+def preview_recommendations(partial_response: dict, fsm: LLMStateMachine):
+    """Prints each recommendation as soon as the model has finished writing it."""
+    recommendations = (partial_response.get("response") or {}).get("primary_recommendations") or []
+    shown = _PREVIEW_SHOWN.get(fsm, 0)
+    if shown == 0 and len(recommendations) > 1:
+        print(GREY + "Drafting recommendations:" + RESET)
+    # The last item may still be streaming, so only print the ones before it
+    for rec in recommendations[shown:-1]:
+        print(GREY + f"- {rec}" + RESET)
+    _PREVIEW_SHOWN[fsm] = max(shown, len(recommendations) - 1)
 
 @fsm.define_state(
     state_key="GENERATE_PLAN",
@@ -255,45 +323,46 @@ async def check_drug_interactions(
     transitions={
         "END": "After plan is generated and explained",
         "EMERGENCY": "If complications arise during plan generation",
-    }
+    },
+    preprocess_input=start_recommendation_preview,
+    on_partial_response=preview_recommendations,
 )
 async def generate_treatment_plan(
     fsm: LLMStateMachine,
     response: TreatmentPlan,
     will_transition: bool
 ) -> str:
-    fsm.set_context_data("treatment_plan", response.model_dump())
+    treatment_plan = response.model_dump()
+    fsm.set_context_data("treatment_plan", treatment_plan)
     
-    plan = "Based on our assessment, here's your care plan:\n\n"
+    parts = ["Based on our assessment, here's your care plan:", ""]
     
-    plan += "Recommendations:\n"
-    for rec in response.primary_recommendations:
-        plan += f"- {rec}\n"
+    parts.append("Recommendations:")
+    parts.extend(f"- {rec}" for rec in response.primary_recommendations)
     
-    plan += "\nLifestyle Modifications:\n"
-    for mod in response.lifestyle_modifications:
-        plan += f"- {mod}\n"
+    parts.extend(("", "Lifestyle Modifications:"))
+    parts.extend(f"- {mod}" for mod in response.lifestyle_modifications)
     
-    plan += f"\nFollow-up Timeline: {response.follow_up_timeline}\n"
+    parts.extend(("", f"Follow-up Timeline: {response.follow_up_timeline}"))
     
-    plan += "\nWarning Signs (Seek immediate care if you experience):\n"
-    for warning in response.warning_signs:
-        plan += f"- {warning}\n"
+    parts.extend(("", "Warning Signs (Seek immediate care if you experience):"))
+    parts.extend(f"- {warning}" for warning in response.warning_signs)
     
-    plan += "\nEmergency Conditions:\n"
-    for condition in response.emergency_conditions:
-        plan += f"- {condition}\n"
+    parts.extend(("", "Emergency Conditions:"))
+    parts.extend(f"- {condition}" for condition in response.emergency_conditions)
+    plan = "\n".join(parts) + "\n"
     
     # Generate audit log
     audit_log = {
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
         "patient_info": fsm.get_context_data("patient_info"),
         "emergency_assessment": fsm.get_context_data("emergency_assessment"),
         "drug_interactions": fsm.get_context_data("drug_interactions"),
         "symptom_assessment": fsm.get_context_data("symptom_assessment"),
-        "treatment_plan": response.model_dump(),
+        "treatment_plan": treatment_plan,
     }
-    fsm.set_context_data("audit_log", audit_log)
+    # Kept serialized, ready to save to a secure medical record system
+    fsm.set_context_data("audit_record", serialize_audit_log(audit_log))
     
     return plan
 
@@ -307,9 +376,6 @@ async def end_state(
     response: DefaultResponse,
     will_transition: bool
 ) -> str:
-    audit_log = fsm.get_context_data("audit_log")
-    # Here you could save the audit log to a secure medical record system
-    
     return (
         "Your assessment is complete. Please follow the provided care plan "
         "and don't hesitate to seek emergency care if warning signs develop. "
@@ -317,7 +383,7 @@ async def end_state(
     )
 
 async def main():
-    openai_client = openai.AsyncOpenAI()
+    openai_client = get_client()
     print(GREY + "Medical Triage System Initialized" + RESET)
     print(GREY + "Please describe your medical concern:" + RESET)
     
@@ -325,13 +391,12 @@ async def main():
         # Instead of fsm.current_state, we print the state from the FSMRun
         run_state: FSMRun = await fsm.run_state_machine(
             openai_client,
-            user_input=input(ORANGE + "You: " + RESET),
-            model="gpt-4o-mini"
+            user_input=await asyncio.to_thread(input, ORANGE + "You: " + RESET),
+            model=LLM_MODEL
         )
         # Assuming run_state has an attribute `state` representing the current state key.
         print(LIGHT_BLUE + f"Current state: {run_state.state}" + RESET)
         print(GREY + f"System: {run_state.response}" + RESET)
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
@@ -1,9 +1,12 @@
+import asyncio
 import os
+from enum import Enum
 from dotenv import load_dotenv
 from pydantic import BaseModel
 import openai
 from fsm_llm.fsm import LLMStateMachine
 from fsm_llm.state_models import FSMRun, DefaultResponse
+from _shared import get_client
 
 # Load environment variables
 load_dotenv()
@@ -20,8 +23,12 @@ class UserIdentificationResponse(BaseModel):
     user_name: str
     phone_number: str
 
+class Confirmation(str, Enum):
+    YES = "yes"
+    NO = "no"
+
 class ConfirmationResponse(BaseModel):
-    confirmation: str  # Expect "yes" or "no"
+    confirmation: Confirmation  # Validated to "yes" or "no" when the response is parsed
 
 # Define the START state
 @fsm.define_state(
@@ -64,14 +71,11 @@ async def start_state(
 async def confirm_state(
     fsm: LLMStateMachine, response: ConfirmationResponse, will_transition: bool
 ):
-    if response.confirmation.lower() == "yes":
+    if response.confirmation is Confirmation.YES:
         fsm.set_next_state("IDENTIFIED")
         return "Thank you for confirming your details. How can I help you?"
-    elif response.confirmation.lower() == "no":
-        fsm.set_next_state("START")
-        return "Let's try again. Please provide your name and phone number."
-    else:
-        return "Invalid response. Please reply with 'yes' or 'no'."
+    fsm.set_next_state("START")
+    return "Let's try again. Please provide your name and phone number."
 
 
 
@@ -101,11 +105,11 @@ async def end_state(fsm: LLMStateMachine, response: DefaultResponse, will_transi
     return "Goodbye! If you need further assistance, feel free to reach out again."
 
 async def main():
-    openai_client = openai.AsyncOpenAI()
+    openai_client = get_client()
 
     print("Agent: Hello! I am your customer service assistant. Say something to get started.")
     while not fsm.is_completed():  # Run until FSM reaches the END state
-        user_input = input("Your input: ")
+        user_input = await asyncio.to_thread(input, "Your input: ")
         if user_input.lower() in ["quit", "exit"]:
             fsm.set_next_state("END")
             break
@@ -117,5 +121,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
@@ -1,11 +1,10 @@
+import asyncio
 import os
 from dotenv import load_dotenv
 import openai
 from fsm_llm import LLMStateMachine
 from fsm_llm.state_models import FSMRun
-
-# Global variable to track on-off state
-SWITCH_STATE = "OFF"
+from _shared import get_client
 
 # Load environment variables
 load_dotenv()
@@ -25,9 +24,8 @@ fsm = LLMStateMachine(initial_state="START", end_state="END")
     transitions={"STATE_ON": "If user wants to turn on the switch", "END": "If user wants to end the conversation"},
 )
 async def start_state(fsm: LLMStateMachine, response: str, will_transition: bool):
-    global SWITCH_STATE
     if will_transition and fsm.get_next_state() == "STATE_ON":
-        SWITCH_STATE = "ON"
+        fsm.set_context_data("switch_state", "ON")
         print("SWITCH TURNED ON")
     elif will_transition and fsm.get_next_state() == "END":
         return "Goodbye!"
@@ -41,9 +39,8 @@ async def start_state(fsm: LLMStateMachine, response: str, will_transition: bool
     transitions={"START": "If user wants to turn off the switch", "END": "If user wants to end the conversation"},
 )
 async def state_on(fsm: LLMStateMachine, response: str, will_transition: bool):
-    global SWITCH_STATE
     if will_transition and fsm.get_next_state() == "START":
-        SWITCH_STATE = "OFF"
+        fsm.set_context_data("switch_state", "OFF")
         print("SWITCH TURNED OFF")
     elif will_transition and fsm.get_next_state() == "END":
         return "Goodbye!"
@@ -62,21 +59,24 @@ async def end_state(fsm: LLMStateMachine, response: str, will_transition: bool):
 async def main():
     """Example of a simple on-off switch FSM using LLMStateMachine"""
     # Create the OpenAI client
-    openai_client = openai.AsyncOpenAI()
+    openai_client = get_client()
+
+    # Each conversation gets its own FSM, so the switch state lives in its context
+    session = fsm.new_session()
+    session.set_context_data("switch_state", "OFF")
 
     print("Agent: Hi. I am an on-off switch manager.")
-    while not fsm.is_completed():  # Run until FSM reaches the END state
-        user_input = input("Your input: ")
+    while not session.is_completed():  # Run until FSM reaches the END state
+        user_input = await asyncio.to_thread(input, "Your input: ")
         if user_input.lower() in ["quit", "exit"]:
-            fsm.set_next_state("END")
+            session.set_next_state("END")
             break
-        run_state: FSMRun = await fsm.run_state_machine(openai_client, user_input=user_input)
+        run_state: FSMRun = await session.run_state_machine(openai_client, user_input=user_input)
         print(f"Agent: {run_state.response}")
-        print("CURRENT SWITCH STATE:", SWITCH_STATE)
+        print("CURRENT SWITCH STATE:", session.get_context_data("switch_state"))
 
     print("Agent: Goodbye.")
 
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
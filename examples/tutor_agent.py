@@ -1,10 +1,12 @@
+import asyncio
 import os
+from typing import Any
 from dotenv import load_dotenv
 import openai
 from fsm_llm import LLMStateMachine
 from fsm_llm.state_models import FSMRun
+from _shared import close_client, get_client
 import json
-import jinja2
 
 # Load environment variables
 load_dotenv()
@@ -16,59 +18,39 @@ openai.organization = os.getenv("OPENAI_ORGANIZATION")
 # Initialize the FSM
 fsm = LLMStateMachine(initial_state="show_content", end_state="END")
 
-# Global variables to track the learning state
-LEARNING_STATE = {
-    "current_content_id": 1,  # Tracks the ID of the content the user is currently on
-}
-
-# Keep track of last user input globally
-LAST_USER_INPUT = ""
-
 # Actions
-USER_ACTIONS = ["ua_next", "ua_ask_clarifying_content", "ua_ask_clarifying_example"]
-SYSTEM_ACTIONS = ["sa_show_content", "sa_show_example", "sa_show_quiz"]
+USER_ACTIONS = ("ua_next", "ua_ask_clarifying_content", "ua_ask_clarifying_example")
+SYSTEM_ACTIONS = ("sa_show_content", "sa_show_example", "sa_show_quiz")
 
-CONTENT_FILE = "content/calculus_content.json"
-# Function to load content dynamically from a file
-def load_content(content_id, file_path=CONTENT_FILE):
-    try:
-        with open(file_path, "r", encoding="utf-8") as file:
-            content_data = json.load(file)  # Assumes content is stored as JSON
+# Combined manifest: {id: {"content": ..., "example": ...}}
+TOPIC_FILE = "content/calculus.json"
 
-        # Loop through the list to find the matching content ID
-        for item in content_data:
-            if item.get("id") == str(content_id):
-                return item.get("content", "Content field not found.")  # Return the 'content' field
+# Parsed manifest, keyed by path: (mtime, {id: topic})
+_CONTENT_CACHE: dict[str, tuple[float, dict[str, Any]]] = {}
 
-        return "Content not found."  # Default if ID not found
-    except json.JSONDecodeError:
-        return "Error: Failed to decode JSON."
-    except FileNotFoundError:
-        return f"Error: File '{file_path}' not found."
-    except Exception as e:
-        return f"Error loading content: {e}"
+def _load_json(file_path):
+    """Load the manifest once, reloading only if the file changed."""
+    mtime = os.stat(file_path).st_mtime
+    cached = _CONTENT_CACHE.get(file_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
 
+    with open(file_path, "r", encoding="utf-8") as file:
+        topics = json.load(file)  # Assumes content is stored as JSON
+    _CONTENT_CACHE[file_path] = (mtime, topics)
+    return topics
 
-
-EXAMPLE_FILE = "content/calculus_example.json"
-# Function to load content dynamically from a file
-def load_example(content_id, file_path=EXAMPLE_FILE):
+# Function to load a topic's content and example dynamically from the manifest (off the event loop)
+async def load_topic(content_id, file_path=TOPIC_FILE):
     try:
-        with open(file_path, "r", encoding="utf-8") as file:
-            example_data = json.load(file)  # Assumes content is stored as JSON
-
-        # Loop through the list to find the matching content ID
-        for item in example_data:
-            if item.get("content_id") == str(content_id):
-                return item.get("example", "example field not found.")  # Return the 'content' field
-
-        return "Example not found."  # Default if ID not found
+        topics = await asyncio.to_thread(_load_json, file_path)
+        return topics.get(str(content_id), {})
     except json.JSONDecodeError:
-        return "Error: Failed to decode JSON."
+        return {"content": "Error: Failed to decode JSON."}
     except FileNotFoundError:
-        return f"Error: File '{file_path}' not found."
+        return {"content": f"Error: File '{file_path}' not found."}
     except Exception as e:
-        return f"Error loading content: {e}"
+        return {"content": f"Error loading topic: {e}"}
 
 SHOW_CONTENT_TEMPLATE = """
 You are a friendly and helpful calculus tutor.
@@ -120,22 +102,9 @@ If they want to end, move to END.
 
 END_TEMPLATE = "The learning session has concluded. Goodbye!"
 
-def preprocess_prompt_template(processed_prompt: str) -> str:
-    """Dynamically fill in user input and content/example before sending to LLM."""
-    topic_id = LEARNING_STATE["current_content_id"]
-    topic_content = load_content(topic_id, CONTENT_FILE)
-    topic_example = load_example(topic_id, EXAMPLE_FILE)
-    user_input = LAST_USER_INPUT
-
-    # Use Jinja2 to render the template dynamically
-    template = jinja2.Template(processed_prompt)
-    rendered = template.render(
-        user_input=user_input,
-        topic_id=topic_id,
-        topic_content=topic_content,
-        topic_example=topic_example
-    )
-    return rendered
+def advance_topic(fsm: LLMStateMachine):
+    """Moves the session on to the next content ID."""
+    fsm.set_context_data("topic_id", fsm.get_context_data("topic_id", 1) + 1)
 
 # Define the `show_content` state
 @fsm.define_state(
@@ -147,12 +116,11 @@ def preprocess_prompt_template(processed_prompt: str) -> str:
         "quiz": "If the user asks for a quiz.",
         "END": "If the user wants to end the session."
     },
-    preprocess_prompt_template=preprocess_prompt_template
 )
 async def show_content_state(fsm: LLMStateMachine, response: str, will_transition: bool):
     # If we are going to show_content again, increment the content_id
     if will_transition and fsm.get_next_state() == "show_content":
-        LEARNING_STATE['current_content_id'] += 1
+        advance_topic(fsm)
     # Return the LLM's response directly, which should now contain the content
     return response
 
@@ -166,11 +134,10 @@ async def show_content_state(fsm: LLMStateMachine, response: str, will_transitio
         "quiz": "If the user asks for a quiz.",
         "END": "If the user wants to end the session."
     },
-    preprocess_prompt_template=preprocess_prompt_template
 )
 async def show_example_state(fsm: LLMStateMachine, response: str, will_transition: bool):
     if will_transition and fsm.get_next_state() == "show_content":
-        LEARNING_STATE['current_content_id'] += 1
+        advance_topic(fsm)
     return response
 
 
@@ -184,12 +151,11 @@ async def show_example_state(fsm: LLMStateMachine, response: str, will_transitio
         "quiz": "If the user wants another quiz.",
         "END": "If the user wants to end the session."
     },
-    preprocess_prompt_template=preprocess_prompt_template
 )
 async def quiz_state(fsm: LLMStateMachine, response: str, will_transition: bool):
     # If transitioning to show_content, increment
     if will_transition and fsm.get_next_state() == "show_content":
-        LEARNING_STATE['current_content_id'] += 1
+        advance_topic(fsm)
     return response
 
 # Define the END state
@@ -207,21 +173,35 @@ async def main():
     import random
 
     # Create the OpenAI client
-    openai_client = openai.AsyncOpenAI()
+    openai_client = get_client()
+
+    # Each learning session gets its own FSM; the prompt templates render from its context
+    session = fsm.new_session()
+    session.set_context_data("topic_id", 1)
 
     print("Tutor: Welcome to the learning session!")
-    while not fsm.is_completed():
-        user_input = input("User: ")
-        if user_input.lower() in ["quit", "exit"]:
-            fsm.set_next_state("END")
-            break
-
-        run_state: FSMRun = await fsm.run_state_machine(openai_client, user_input=user_input)
-        print(f"Tutor: {run_state.response}")
-        print("CURRENT CONTENT ID:", LEARNING_STATE["current_content_id"])
+    try:
+        while not session.is_completed():
+            user_input = await asyncio.to_thread(input, "User: ")
+            if user_input.lower() in ["quit", "exit"]:
+                session.set_next_state("END")
+                break
+
+            # Load the current topic without blocking the event loop
+            topic = await load_topic(session.get_context_data("topic_id"))
+            session.set_context_data_dict({
+                "user_input": user_input,
+                "topic_content": topic.get("content", "Content not found."),
+                "topic_example": topic.get("example", "Example not found."),
+            })
+
+            run_state: FSMRun = await session.run_state_machine(openai_client, user_input=user_input)
+            print(f"Tutor: {run_state.response}")
+            print("CURRENT CONTENT ID:", session.get_context_data("topic_id"))
+    finally:
+        await close_client()
     print("Agent: Goodbye.")
 
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
@@ -1,10 +1,14 @@
+import asyncio
 import os
+import sys
+import textwrap
+from functools import lru_cache
 from dotenv import load_dotenv
 import openai
 from fsm_llm import LLMStateMachine
-from fsm_llm.state_models import FSMRun
+from fsm_llm.state_models import FSMError, FSMRun
+from _shared import close_client, get_client
 import json
-import jinja2
 
 # Load environment variables
 load_dotenv()
@@ -13,63 +17,76 @@ load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 openai.organization = os.getenv("OPENAI_ORGANIZATION")
 
+# State keys, interned so the handlers can compare them by identity
+_S_CONTENT = sys.intern("show_content")
+_S_EXAMPLE = sys.intern("show_example")
+_S_QUIZ = sys.intern("quiz")
+_S_END = sys.intern("END")
+
 # Initialize the FSM
-fsm = LLMStateMachine(initial_state="show_content", end_state="END")
+fsm = LLMStateMachine(initial_state=_S_CONTENT, end_state=_S_END)
+LLM_MODEL = "gpt-4o-mini"
 
-# Global variables to track the learning state
+# Learning state, refreshed once per turn; its keys match the prompt template fields
 LEARNING_STATE = {
-    "current_content_id": 1,  # Tracks the ID of the content the user is currently on
+    "topic_id": 1,  # Tracks the ID of the content the user is currently on
+    "user_input": "",  # The user's latest message
+    "topic_content": "",  # Content for topic_id
+    "topic_example": "",  # Example for topic_id
 }
 
-# Keep track of last user input globally
-LAST_USER_INPUT = ""
-
-# Actions
-USER_ACTIONS = ["ua_next", "ua_ask_clarifying_content", "ua_ask_clarifying_example"]
-SYSTEM_ACTIONS = ["sa_show_content", "sa_show_example", "sa_show_quiz"]
-
-CONTENT_FILE = "content/calculus_content.json"
-EXAMPLE_FILE = "content/calculus_example.json"
-
-def load_content(content_id, file_path=CONTENT_FILE):
-    try:
-        with open(file_path, "r", encoding="utf-8") as file:
-            content_data = json.load(file)
-        for item in content_data:
-            if item.get("id") == str(content_id):
-                return item.get("content", "Content field not found.")
-        return "Content not found."
-    except json.JSONDecodeError:
-        return "Error: Failed to decode JSON."
-    except FileNotFoundError:
-        return f"Error: File '{file_path}' not found."
-    except Exception as e:
-        return f"Error loading content: {e}"
-
-def load_example(content_id, file_path=EXAMPLE_FILE):
+# Actions, mapped to the state each one moves the FSM to
+USER_ACTION_TO_STATE = {
+    "ua_next": _S_CONTENT,
+    "ua_ask_clarifying_content": _S_CONTENT,
+    "ua_ask_clarifying_example": _S_EXAMPLE,
+}
+SYSTEM_ACTION_TO_STATE = {
+    "sa_show_content": _S_CONTENT,
+    "sa_show_example": _S_EXAMPLE,
+    "sa_show_quiz": _S_QUIZ,
+}
+USER_ACTIONS = tuple(USER_ACTION_TO_STATE)
+SYSTEM_ACTIONS = tuple(SYSTEM_ACTION_TO_STATE)
+
+# Combined manifest: {id: {"content": ..., "example": ...}}
+TOPIC_FILE = "content/calculus.json"
+
+@lru_cache(maxsize=4)
+def _load_json(file_path, mtime):
+    """Parse a content file once per modification time; callers pass the current mtime."""
+    # Hand the raw bytes to the parser instead of decoding through a text stream first
+    with open(file_path, "rb") as file:
+        return json.loads(file.read())
+
+# Last topic loaded successfully, so turns that stay on a topic skip the file check and lookup
+_LAST_TOPIC = {"key": None, "topic": None}
+
+def load_topic(content_id, file_path=TOPIC_FILE):
+    """Returns the content and example for a topic with a single file read and dict lookup."""
+    key = (file_path, content_id)
+    if _LAST_TOPIC["key"] == key:
+        return _LAST_TOPIC["topic"]
     try:
-        with open(file_path, "r", encoding="utf-8") as file:
-            example_data = json.load(file)
-        for item in example_data:
-            if item.get("content_id") == str(content_id):
-                return item.get("example", "Example field not found.")
-        return "Example not found."
+        topic = _load_json(file_path, os.path.getmtime(file_path)).get(str(content_id), {})
     except json.JSONDecodeError:
-        return "Error: Failed to decode JSON."
+        return {"content": "Error: Failed to decode JSON."}
     except FileNotFoundError:
-        return f"Error: File '{file_path}' not found."
+        return {"content": f"Error: File '{file_path}' not found."}
     except Exception as e:
-        return f"Error loading example: {e}"
+        return {"content": f"Error loading topic: {e}"}
+    _LAST_TOPIC.update(key=key, topic=topic)
+    return topic
 
 SHOW_CONTENT_TEMPLATE = """
 You are a friendly and helpful calculus tutor.
-The user said: "{{ user_input }}"
+The user said: "{user_input}"
 
-Current Topic ID: {{ topic_id }}
+Current Topic ID: {topic_id}
 Content for this topic:
-{{ topic_content }}
+{topic_content}
 
-Explain this content in a helpful way. If the user wants more content, you can move to show_content. 
+Explain this content in a helpful way. If the user wants more content, you can move to show_content.
 If they want an example, move to show_example.
 If they want a quiz, move to quiz.
 If they want to end, move to END.
@@ -79,14 +96,14 @@ Include the content above in your explanation to the user.
 
 SHOW_EXAMPLE_TEMPLATE = """
 You are a friendly and helpful calculus tutor.
-The user said: "{{ user_input }}"
+The user said: "{user_input}"
 
-Current Topic ID: {{ topic_id }}
+Current Topic ID: {topic_id}
 Previously shown content:
-{{ topic_content }}
+{topic_content}
 
 Example for this topic:
-{{ topic_example }}
+{topic_example}
 
 Explain the example and how it relates to the content. If the user wants more content, move to show_content.
 If they want another example, move to show_example.
@@ -96,11 +113,11 @@ If they want to end, move to END.
 
 QUIZ_TEMPLATE = """
 You are a friendly and helpful calculus tutor.
-The user said: "{{ user_input }}"
+The user said: "{user_input}"
 
-Current Topic ID: {{ topic_id }}
+Current Topic ID: {topic_id}
 Previously shown content:
-{{ topic_content }}
+{topic_content}
 
 Please create a short quiz related to the above content. Include a few questions and maybe some hints.
 If the user wants more content after this, move to show_content.
@@ -111,26 +128,45 @@ If they want to end, move to END.
 
 END_TEMPLATE = "The learning session has concluded. Goodbye!"
 
+# Trim the templates once at import so stray whitespace isn't sent with every prompt
+SHOW_CONTENT_TEMPLATE, SHOW_EXAMPLE_TEMPLATE, QUIZ_TEMPLATE = (
+    textwrap.dedent(template).strip()
+    for template in (SHOW_CONTENT_TEMPLATE, SHOW_EXAMPLE_TEMPLATE, QUIZ_TEMPLATE)
+)
+
+# Replies for user actions, which force the next state and so need no LLM call
+FORCED_RESPONSE_TEMPLATES = {
+    _S_CONTENT: "Here is topic {topic_id}:\n{topic_content}",
+    _S_EXAMPLE: "Here is an example for topic {topic_id}:\n{topic_example}",
+}
+
+async def update_learning_state(user_input: str):
+    """Resolve everything the prompt needs for this turn in one place."""
+    # Content and example come from one manifest read, done off the event loop
+    topic = await asyncio.to_thread(load_topic, LEARNING_STATE["topic_id"])
+    LEARNING_STATE["user_input"] = user_input
+    LEARNING_STATE["topic_content"] = topic.get("content", "Content not found.")
+    LEARNING_STATE["topic_example"] = topic.get("example", "Example not found.")
+
 def preprocess_prompt_template(processed_prompt: str) -> str:
-    """Dynamically fill in user input and content/example before sending to LLM."""
-    topic_id = LEARNING_STATE["current_content_id"]
-    topic_content = load_content(topic_id, CONTENT_FILE)
-    topic_example = load_example(topic_id, EXAMPLE_FILE)
-    user_input = LAST_USER_INPUT
-
-    # Use Jinja2 to render the template dynamically
-    template = jinja2.Template(processed_prompt)
-    rendered = template.render(
-        user_input=user_input,
-        topic_id=topic_id,
-        topic_content=topic_content,
-        topic_example=topic_example
-    )
-    return rendered
+    """Fill in user input and content/example from the learning state before sending to LLM."""
+    # Plain substitution only, so str.format is enough; Jinja leaves the single braces untouched
+    return processed_prompt.format_map(LEARNING_STATE)
+
+def advance_topic(next_state: str, will_transition: bool):
+    """Moving on to show_content from another state advances to the next topic."""
+    if will_transition and next_state is _S_CONTENT:
+        LEARNING_STATE['topic_id'] += 1
+
+async def learning_state_handler(fsm: LLMStateMachine, response: str, will_transition: bool):
+    """Shared by the learning states, which only need to keep the topic in step."""
+    advance_topic(fsm.get_next_state(), will_transition)
+    # Return the LLM's response directly, which should now contain the content
+    return response
 
 # Define the `show_content` state
-@fsm.define_state(
-    state_key="show_content",
+fsm.define_state(
+    state_key=_S_CONTENT,
     prompt_template=SHOW_CONTENT_TEMPLATE,
     transitions={
         "show_content": "If the user wants to move to the next section.",
@@ -139,17 +175,11 @@ def preprocess_prompt_template(processed_prompt: str) -> str:
         "END": "If the user wants to end the session."
     },
     preprocess_prompt_template=preprocess_prompt_template
-)
-async def show_content_state(fsm: LLMStateMachine, response: str, will_transition: bool):
-    # If we are going to show_content again, increment the content_id
-    if will_transition and fsm.get_next_state() == "show_content":
-        LEARNING_STATE['current_content_id'] += 1
-    # Return the LLM's response directly, which should now contain the content
-    return response
+)(learning_state_handler)
 
 # Define the `show_example` state
-@fsm.define_state(
-    state_key="show_example",
+fsm.define_state(
+    state_key=_S_EXAMPLE,
     prompt_template=SHOW_EXAMPLE_TEMPLATE,
     transitions={
         "show_content": "If the user asks for more content.",
@@ -158,15 +188,11 @@ async def show_content_state(fsm: LLMStateMachine, response: str, will_transitio
         "END": "If the user wants to end the session."
     },
     preprocess_prompt_template=preprocess_prompt_template
-)
-async def show_example_state(fsm: LLMStateMachine, response: str, will_transition: bool):
-    if will_transition and fsm.get_next_state() == "show_content":
-        LEARNING_STATE['current_content_id'] += 1
-    return response
+)(learning_state_handler)
 
 # Define the `quiz` state
-@fsm.define_state(
-    state_key="quiz",
+fsm.define_state(
+    state_key=_S_QUIZ,
     prompt_template=QUIZ_TEMPLATE,
     transitions={
         "show_content": "If the user asks for more content.",
@@ -175,16 +201,11 @@ async def show_example_state(fsm: LLMStateMachine, response: str, will_transitio
         "END": "If the user wants to end the session."
     },
     preprocess_prompt_template=preprocess_prompt_template
-)
-async def quiz_state(fsm: LLMStateMachine, response: str, will_transition: bool):
-    # If transitioning to show_content, increment
-    if will_transition and fsm.get_next_state() == "show_content":
-        LEARNING_STATE['current_content_id'] += 1
-    return response
+)(learning_state_handler)
 
 # Define the END state
 @fsm.define_state(
-    state_key="END",
+    state_key=_S_END,
     prompt_template=END_TEMPLATE
 )
 async def end_state(fsm: LLMStateMachine, response: str):
@@ -194,42 +215,142 @@ async def end_state(fsm: LLMStateMachine, response: str):
 async def main():
     """Simulates a learning session with the tutor agent."""
     import random
-    openai_client = openai.AsyncOpenAI()
+    openai_client = get_client()
 
     print("Tutor: Welcome to the learning session!")
-    while not fsm.is_completed():
-        user_input = input("User: ")
-        if user_input.lower() in ["quit", "exit"]:
-            fsm.set_next_state("END")
-            break
-
-        global LAST_USER_INPUT
-        LAST_USER_INPUT = user_input
-
-        # Simulate user and system actions
-        user_action = random.choice(USER_ACTIONS) if user_input.strip() == "" else user_input
-        if user_action in USER_ACTIONS:
-            print(f"[User Action Triggered: {user_action}]")
-            if user_action == "ua_next":
-                fsm.set_next_state("show_content")
-            elif user_action == "ua_ask_clarifying_content":
-                fsm.set_next_state("show_content")
-            elif user_action == "ua_ask_clarifying_example":
-                fsm.set_next_state("show_example")
-        else:
-            system_action = random.choice(SYSTEM_ACTIONS)
-            print(f"[System Action Triggered: {system_action}]")
-            if system_action == "sa_show_content":
-                fsm.set_next_state("show_content")
-            elif system_action == "sa_show_example":
-                fsm.set_next_state("show_example")
-            elif system_action == "sa_show_quiz":
-                fsm.set_next_state("quiz")
-
-        run_state: FSMRun = await fsm.run_state_machine(openai_client, user_input=user_input)
-        print(f"Tutor: {run_state.response}")
-        print("CURRENT CONTENT ID:", LEARNING_STATE["current_content_id"])
+    try:
+        while not fsm.is_completed():
+            user_input = await asyncio.to_thread(input, "User: ")
+            if user_input.lower() in ["quit", "exit"]:
+                fsm.set_next_state(_S_END)
+                break
+
+            await update_learning_state(user_input)
+
+            # Simulate user and system actions
+            user_action = random.choice(USER_ACTIONS) if user_input.strip() == "" else user_input
+            next_state = USER_ACTION_TO_STATE.get(user_action)
+            if next_state:
+                print(f"[User Action Triggered: {user_action}]")
+                # The target state is already known, so answer from the loaded topic directly
+                will_transition = fsm.get_curr_state() is not next_state
+                response = FORCED_RESPONSE_TEMPLATES[next_state].format_map(LEARNING_STATE)
+                run_state: FSMRun = fsm.record_turn(user_input, response, next_state)
+                advance_topic(next_state, will_transition)
+            else:
+                system_action = random.choice(SYSTEM_ACTIONS)
+                print(f"[System Action Triggered: {system_action}]")
+                fsm.set_next_state(SYSTEM_ACTION_TO_STATE[system_action])
+                run_state: FSMRun = await fsm.run_state_machine(
+                    openai_client, user_input=user_input, model=LLM_MODEL
+                )
+            print(f"Tutor: {run_state.response}")
+            print("CURRENT CONTENT ID:", LEARNING_STATE["topic_id"])
+    finally:
+        await close_client()
+
+def batch_error(record: dict):
+    """Returns why a batch request failed, or None if it produced an answer."""
+    if not record:
+        return "No result was returned for this request."
+    if record.get("error"):
+        return record["error"].get("message") or str(record["error"])
+    response = record.get("response") or {}
+    if response.get("status_code") != 200:
+        error = (response.get("body") or {}).get("error") or {}
+        return error.get("message") or f"Request failed with status {response.get('status_code')}."
+    return None
+
+# Offline evaluation over prerecorded inputs
+async def main_batch(user_inputs: list[str], model: str = LLM_MODEL, poll_interval: float = 30.0) -> list[FSMRun]:
+    """Answers prerecorded user inputs through the OpenAI Batch API instead of one call per turn.
+
+    Each input is answered independently in the `show_content` state for the current topic,
+    so this is meant for evaluation runs rather than interactive sessions.
+    """
+    try:
+        openai_client = get_client()
+        topic_id = LEARNING_STATE["topic_id"]
+
+        # One chat completion request per prerecorded turn
+        requests = []
+        for i, user_input in enumerate(user_inputs):
+            await update_learning_state(user_input)
+            prompt = SHOW_CONTENT_TEMPLATE.format_map(LEARNING_STATE)
+            requests.append(json.dumps({
+                "custom_id": f"turn-{i}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": model,
+                    "messages": [
+                        {"role": "system", "content": prompt},
+                        {"role": "user", "content": user_input},
+                    ],
+                },
+            }))
+
+        batch_file = await openai_client.files.create(
+            file=("tutor_batch.jsonl", "\n".join(requests).encode("utf-8")),
+            purpose="batch",
+        )
+        batch = await openai_client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(poll_interval)
+            batch = await openai_client.batches.retrieve(batch.id)
+        if batch.status != "completed":
+            raise FSMError(f"Batch {batch.id} finished with status '{batch.status}'.")
+
+        # A batch whose requests all failed only has an error file
+        if not batch.output_file_id:
+            raise FSMError(f"Batch {batch.id} produced no output; see error file '{batch.error_file_id}'.")
+
+        # Results come back in arbitrary order, keyed by custom_id; failed requests go to the error file
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            output = await openai_client.files.content(file_id)
+            for line in output.text.splitlines():
+                record = json.loads(line)
+                results[record["custom_id"]] = record
+
+        runs = []
+        for i, user_input in enumerate(user_inputs):
+            record = results.get(f"turn-{i}", {})
+            context_data = {"topic_id": topic_id}
+            error = batch_error(record)
+            if error:
+                # Surface failures instead of passing them off as empty answers
+                context_data["error"] = error
+                response = f"Error: {error}"
+            else:
+                choices = record["response"]["body"].get("choices") or [{}]
+                response = choices[0].get("message", {}).get("content") or ""
+            runs.append(FSMRun(
+                state=_S_CONTENT,
+                chat_history=[
+                    {"role": "user", "content": user_input},
+                    {"role": "assistant", "content": response},
+                ],
+                context_data=context_data,
+                response_raw=record,
+                response=response,
+            ))
+        return runs
+    finally:
+        await close_client()
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
+    # `python tutor_agent_modified.py inputs.txt` evaluates one prerecorded input per line
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "r", encoding="utf-8") as file:
+            inputs = [line.strip() for line in file if line.strip()]
+        for run_state in asyncio.run(main_batch(inputs)):
+            print(f"Tutor: {run_state.response}")
+    else:
+        asyncio.run(main())
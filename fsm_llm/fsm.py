@@ -1,8 +1,8 @@
 import logging
 from functools import wraps
-from typing import Any, Callable, Dict, Optional, Type
+from typing import Any, Callable, Dict, Optional, Type, Union
 import openai
-from pydantic import BaseModel, ValidationError
+from pydantic import BaseModel
 
 from fsm_llm.utils import _add_transitions, _generate_response_schema
 from fsm_llm.llm_handler import LLMUtilities  # Updated import
@@ -47,16 +47,24 @@ class LLMStateMachine:
         self.user_defined_context = {}
         self._llm_utils = LLMUtilities()
 
+    def new_session(self) -> "LLMStateMachine":
+        """Returns a fresh FSM that shares this FSM's state definitions but none of its session data."""
+        session = LLMStateMachine(self._initial_state, self._end_state)
+        session._state_registry = self._state_registry
+        return session
+
     def define_state(
         self,
         state_key: str,
-        prompt_template: str,
+        prompt_template: Union[str, Callable] = "",
         preprocess_prompt_template: Optional[Callable] = None,
         temperature: float = 0.5,
         transitions: Dict[str, str] = None,
         response_model: Optional[BaseModel] = None,
         preprocess_input: Optional[Callable] = None,
         preprocess_chat: Optional[Callable] = None,
+        static_response: Optional[str] = None,
+        on_partial_response: Optional[Callable] = None,
     ):
         """
         Decorator to define and register a state [@fsm.define_state(...)] in the FSM (Finite State Machine).
@@ -66,7 +74,9 @@ class LLMStateMachine:
 
         Parameters:
         - state_key (str): A unique identifier for the state.
-        - prompt_template (str): Instructions provided to the LLM when this state is active.
+        - prompt_template (Union[str, Callable]): Instructions provided to the LLM when this state is active.
+                                                  A callable (fsm) -> str is evaluated lazily on every turn;
+                                                  its result is used as-is, without Jinja2 rendering.
         - preprocess_prompt_template (Optional[Callable]): A func to preprocess the sys prompt for the LLM.
         - temperature (float): Determines the randomness of LLM responses, defaults at 0.5.
         - transitions (Dict[str, str], optional): Maps possible next states to their conditions 
@@ -74,6 +84,13 @@ class LLMStateMachine:
         - response_model (Optional[BaseModel]): A Pydantic model for parsing and validating the LLM's response.
         - preprocess_input (Optional[Callable]): A func to preprocess user input before sending to the LLM.
         - preprocess_chat (Optional[Callable]): A func to preprocess the chat history for the LLM.
+        - static_response (Optional[str]): A fixed response that skips the LLM call for this state. The state
+                                           function receives it as a DefaultResponse (or as a plain string when
+                                           no response_model is set) and the FSM stays in the state unless the
+                                           function calls set_next_state.
+        - on_partial_response (Optional[Callable]): Streams the LLM response for this state and calls this func with
+                                                    (partial_response: dict, fsm) as the JSON arrives. The state
+                                                    function still runs once on the complete, validated response.
 
         Returns:
         - callable The original function wrapped and registered with the FSM.
@@ -83,6 +100,12 @@ class LLMStateMachine:
         if transitions is None:
             transitions = {}
 
+        # A static response can only stand in for the default response model
+        if static_response is not None and response_model not in (None, DefaultResponse):
+            raise FSMError(
+                f"State '{state_key}' uses static_response, which requires DefaultResponse or no response_model."
+            )
+
         def decorator(func: Callable):
             @wraps(func)
             async def wrapper(*args, **kwargs):
@@ -97,8 +120,12 @@ class LLMStateMachine:
                 temperature=temperature,
                 transitions=transitions,
                 response_model=response_model,
+                # Built once here rather than on every turn
+                response_schema=_generate_response_schema(response_model, transitions, state_key),
                 preprocess_input=preprocess_input,
                 preprocess_chat=preprocess_chat,
+                static_response=static_response,
+                on_partial_response=on_partial_response,
             )
             return wrapper
         return decorator
@@ -137,39 +164,40 @@ class LLMStateMachine:
         chat_history_copy.append({"role": "user", "content": user_input})
         full_session_history_copy.append({"role": "user", "content": user_input})
 
-        # Generate response using our LLMUtilities
-        response_schema = _generate_response_schema(
-            current_state.response_model, 
-            current_state.transitions, 
-            current_state.key
-        )
-        
-        # Generate a response using the LLM
-        response_data = await self._llm_utils.get_completion(
-            async_openai_instance,
-            chat_history_copy,
-            response_schema,
-            model,
-            current_state
-        )
+        if current_state.static_response is not None:
+            # Static states answer without an LLM round-trip
+            response_data = {
+                "response": {"content": current_state.static_response},
+                "next_state_key": current_state.key,
+            }
+            next_state_key = current_state.key
+            if current_state.response_model:
+                parsed_response = DefaultResponse(content=current_state.static_response)
+            else:
+                parsed_response = current_state.static_response
+        else:
+            # Generate a response using the LLM (already validated against response_schema)
+            completion = await self._llm_utils.get_parsed_completion(
+                async_openai_instance,
+                chat_history_copy,
+                current_state.response_schema,
+                model,
+                current_state,
+                fsm_instance=self,
+            )
+            response_data = completion.model_dump()
 
-        # Extract response and next state
-        next_state_key = response_data.get("next_state_key", current_state.key)
-        raw_response = response_data.get("response")
+            # Extract response and next state
+            next_state_key = completion.next_state_key or current_state.key
 
-        # Validate response
-        if current_state.response_model:
-            try:
-                parsed_response = current_state.response_model(**raw_response)
-            except ValidationError as error:
-                raise FSMError(f"Error parsing response: {error}")
-        else:
-            parsed_response = raw_response.get("content", raw_response)
+            # Reuse the validated response instead of re-validating its dump
+            if current_state.response_model:
+                parsed_response = completion.response
+            else:
+                parsed_response = completion.response.content
 
-        # Validate and update next state
-        if next_state_key not in self._state_registry:
-            next_state_key = current_state.key
-        self._next_state = next_state_key
+        # Validate and update next state, keeping the registered key object so keys compare by identity
+        self._next_state = self._state_registry.get(next_state_key, current_state).key
 
         # Execute state logic
         function_context = {
@@ -212,6 +240,39 @@ class LLMStateMachine:
             response_raw=response_data,
             response=final_response_str,
         )
+
+    def record_turn(self, user_input: str, response: str, next_state: str) -> FSMRun:
+        """
+        Records a turn that was answered without running the state machine and moves the FSM to `next_state`.
+        Useful when the caller already knows both the transition and the reply, so no LLM call is needed.
+
+        Parameters:
+        - user_input (str): User input for the turn.
+        - response (str): The reply to record for the turn.
+        - next_state (str): The state the FSM moves to after the turn.
+
+        Returns:
+        - FSMRun: A structured representation of the FSM's state, chat history, and response.
+        """
+        if next_state not in self._state_registry:
+            raise FSMError(f"State '{next_state}' not found in the state registry.")
+
+        turn = [
+            {"role": "user", "content": user_input},
+            {"role": "assistant", "content": response},
+        ]
+        self._session_history = self._session_history + turn
+        self._full_session_history = self._full_session_history + turn
+        self._state = self._state_registry[next_state].key
+        self._next_state = None
+
+        return FSMRun(
+            state=self._state,
+            chat_history=self._session_history,
+            context_data=self.user_defined_context,
+            response_raw={"response": {"content": response}, "next_state_key": next_state},
+            response=response,
+        )
     
     def reset(self):
         """Resets the FSM to its initial state."""
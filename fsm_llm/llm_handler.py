@@ -1,3 +1,5 @@
+import os
+from functools import lru_cache
 from typing import Callable, Dict, Any, Optional, Type
 from pydantic import BaseModel
 import openai
@@ -5,6 +7,37 @@ import jinja2
 from .state_models import FSMError, FSMState
 from .utils import _add_transitions
 
+def _prompt_bytecode_cache() -> Optional[jinja2.BytecodeCache]:
+    """Opt-in on-disk cache of compiled prompts, shared across processes.
+
+    Only used when FSM_LLM_JINJA_CACHE_DIR is set (and the directory is usable). Just the fixed string
+    templates from `define_state` are compiled, so no per-turn data ends up on disk.
+    """
+    directory = os.getenv("FSM_LLM_JINJA_CACHE_DIR")
+    if not directory:
+        return None
+    directory = os.path.expanduser(directory)
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        return None
+    return jinja2.FileSystemBytecodeCache(directory)
+
+@lru_cache(maxsize=1)
+def _prompt_env() -> jinja2.Environment:
+    """Shared Jinja2 environment for system prompts, created on first render.
+
+    Templates are looked up by their own source, so each distinct prompt is compiled once
+    and then served from the environment's cache.
+    """
+    return jinja2.Environment(
+        loader=jinja2.FunctionLoader(lambda source: source),
+        bytecode_cache=_prompt_bytecode_cache(),
+        cache_size=64,
+        auto_reload=False,
+        autoescape=False,
+    )
+
 class LLMUtilities:
     """Handles all LLM-related operations including prompt processing and API calls."""
     
@@ -15,14 +48,43 @@ class LLMUtilities:
         response_model: Type[BaseModel],
         llm_model: str,
         current_state: Optional[FSMState] = None,
+        fsm_instance = None,
     ) -> dict:
         """Get completion from LLM with optional state-specific processing"""
+        parsed = await LLMUtilities.get_parsed_completion(
+            async_openai_instance,
+            chat_history,
+            response_model,
+            llm_model,
+            current_state,
+            fsm_instance,
+        )
+        return parsed.model_dump()
+
+    @staticmethod
+    async def get_parsed_completion(
+        async_openai_instance: openai.AsyncOpenAI,
+        chat_history: list,
+        response_model: Type[BaseModel],
+        llm_model: str,
+        current_state: Optional[FSMState] = None,
+        fsm_instance = None,
+    ) -> BaseModel:
+        """Get completion from LLM as the validated `response_model` instance"""
         if current_state:
+            # Lazy prompts are resolved against the running FSM and already final, so they may
+            # embed user data safely; only fixed string templates are rendered with Jinja2
+            prompt_template = current_state.prompt_template
+            is_lazy_prompt = callable(prompt_template)
+            if is_lazy_prompt:
+                prompt_template = prompt_template(fsm_instance)
+
             # Process state-specific prompt and chat history
             processed_prompt = LLMUtilities.process_prompt_template(
-                current_state.prompt_template,
-                getattr(current_state, 'user_defined_context', {}),
-                current_state.preprocess_prompt_template
+                prompt_template,
+                fsm_instance.get_full_context_data() if fsm_instance else {},
+                current_state.preprocess_prompt_template,
+                render=not is_lazy_prompt,
             )
             processed_prompt = _add_transitions(processed_prompt, current_state)
             
@@ -32,29 +94,44 @@ class LLMUtilities:
             if current_state.preprocess_chat:
                 chat_history = current_state.preprocess_chat(chat_history)
         
-        # Execute LLM call
-        completion = await async_openai_instance.beta.chat.completions.parse(
-            model=llm_model,
-            messages=chat_history,
-            response_format=response_model,
-        )
+        # Execute LLM call, streaming partial responses to the state if it asked for them
+        on_partial_response = current_state.on_partial_response if current_state else None
+        if on_partial_response:
+            async with async_openai_instance.beta.chat.completions.stream(
+                model=llm_model,
+                messages=chat_history,
+                response_format=response_model,
+            ) as stream:
+                async for event in stream:
+                    if event.type == "content.delta" and event.parsed is not None:
+                        on_partial_response(event.parsed, fsm_instance)
+                completion = await stream.get_final_completion()
+        else:
+            completion = await async_openai_instance.beta.chat.completions.parse(
+                model=llm_model,
+                messages=chat_history,
+                response_format=response_model,
+            )
         
         message = completion.choices[0].message
         if not message.parsed:
             raise FSMError(f"Error in parsing the completion: {message.refusal}")
             
-        return message.parsed.model_dump()
+        return message.parsed
 
     @staticmethod
     def process_prompt_template(
         prompt_template: str,
         context: Dict[str, Any],
         preprocess_prompt_template: Optional[Callable] = None,
+        render: bool = True,
     ) -> str:
         """Process the system prompt with Jinja2 templates and optional pre-processing"""
-        # Pre-process system prompt with Jinja2
-        template = jinja2.Template(prompt_template)
-        processed_prompt = template.render(context)
+        # Pre-process system prompt with Jinja2 (skipped for prompts that are already final)
+        if render:
+            processed_prompt = _prompt_env().get_template(prompt_template).render(context)
+        else:
+            processed_prompt = prompt_template
 
         if preprocess_prompt_template:
             processed_prompt = (
@@ -1,4 +1,4 @@
-from typing import Any, Callable, Optional, Type
+from typing import Any, Callable, Optional, Type, Union
 import pydantic
 from pydantic import BaseModel
 
@@ -8,23 +8,29 @@ class FSMState(pydantic.BaseModel):
     Params:
     - key (str): Unique identifier for the state.
     - func (Callable): Function defining the state action.
-    - prompt_template (str): System prompt for the model.
+    - prompt_template (Union[str, Callable]): System prompt for the model, or a callable (fsm) -> str evaluated each turn (not Jinja2-rendered).
     - temperature (float): Model's response randomness.
     - transitions (dict[str, str]): Maps user inputs to next states.
     - response_model (Optional[Type[BaseModel]]): Model for parsing the AI's response.
+    - response_schema (Type[BaseModel]): Structured-output model wrapping the response and next state, built once.
     - preprocess_input (Optional[Callable]): Preprocess user input before state function.
     - preprocess_chat (Optional[Callable]): Preprocess chat history before state function.
     - preprocess_prompt_template (Optional[Callable]): Preprocess the system prompt.
+    - static_response (Optional[str]): Fixed response used instead of calling the model.
+    - on_partial_response (Optional[Callable]): Receives the partially parsed response while it streams.
     """
     key: str
     func: Callable
-    prompt_template: str
+    prompt_template: Union[str, Callable]
     temperature: float
     transitions: dict[str, str]
     response_model: Optional[Type[BaseModel]]
+    response_schema: Type[BaseModel]
     preprocess_input: Optional[Callable]
     preprocess_chat: Optional[Callable]
     preprocess_prompt_template: Optional[Callable]
+    static_response: Optional[str] = None
+    on_partial_response: Optional[Callable] = None
 
 class DefaultResponse(BaseModel):
     """Default response model for AI output.
@@ -0,0 +1,124 @@
+import unittest
+
+from fsm_llm import LLMStateMachine
+from fsm_llm.state_models import DefaultResponse, FSMError
+
+from test_llm_handler import make_client
+
+
+class StaticResponseTest(unittest.IsolatedAsyncioTestCase):
+    async def test_static_state_skips_llm(self):
+        fsm = LLMStateMachine(initial_state="START")
+        received = []
+
+        @fsm.define_state(state_key="START", static_response="Working on it.", transitions={"DONE": "When done"})
+        async def start_state(fsm, response, will_transition):
+            received.append((response, will_transition))
+            fsm.set_next_state("DONE")
+            return "Done."
+
+        @fsm.define_state(state_key="DONE", prompt_template="Finished.")
+        async def done_state(fsm, response, will_transition):
+            return response
+
+        client, completions = make_client()
+        run = await fsm.run_state_machine(client, user_input="go")
+
+        self.assertEqual(completions.calls, [])
+        self.assertEqual(received, [("Working on it.", False)])
+        self.assertEqual(run.state, "DONE")
+        self.assertEqual(run.response, "Done.")
+
+    async def test_static_state_passes_default_response(self):
+        fsm = LLMStateMachine(initial_state="START")
+
+        @fsm.define_state(state_key="START", response_model=DefaultResponse, static_response="Hi.")
+        async def start_state(fsm, response, will_transition):
+            return f"{type(response).__name__}: {response.content}"
+
+        client, _ = make_client()
+        run = await fsm.run_state_machine(client, user_input="go")
+        self.assertEqual(run.response, "DefaultResponse: Hi.")
+        self.assertEqual(run.state, "START")
+
+    def test_static_response_requires_default_model(self):
+        class Custom(DefaultResponse):
+            extra: str
+
+        fsm = LLMStateMachine(initial_state="START")
+        with self.assertRaises(FSMError):
+            fsm.define_state(state_key="START", response_model=Custom, static_response="Hi.")
+
+
+class NewSessionTest(unittest.IsolatedAsyncioTestCase):
+    async def test_sessions_share_states_but_not_data(self):
+        fsm = LLMStateMachine(initial_state="START")
+
+        @fsm.define_state(state_key="START", prompt_template="Hello {{ name }}")
+        async def start_state(fsm, response, will_transition):
+            return response
+
+        first, second = fsm.new_session(), fsm.new_session()
+        self.assertIs(first._state_registry, fsm._state_registry)
+        self.assertIs(second._state_registry, fsm._state_registry)
+
+        first.set_context_data("name", "ada")
+        second.set_context_data("name", "bob")
+        client, completions = make_client()
+        await first.run_state_machine(client, user_input="hi from ada")
+        await second.run_state_machine(client, user_input="hi from bob")
+
+        self.assertTrue(completions.calls[0][0]["content"].startswith("Hello ada"))
+        self.assertTrue(completions.calls[1][0]["content"].startswith("Hello bob"))
+        self.assertEqual(first.get_full_session_history()[0]["content"], "hi from ada")
+        self.assertEqual(second.get_full_session_history()[0]["content"], "hi from bob")
+        self.assertEqual(len(first.get_full_session_history()), 2)
+        self.assertEqual(fsm.get_full_context_data(), {})
+        self.assertEqual(fsm.get_full_session_history(), [])
+
+
+class RecordTurnTest(unittest.IsolatedAsyncioTestCase):
+    def make_fsm(self):
+        fsm = LLMStateMachine(initial_state="START")
+
+        @fsm.define_state(state_key="START", prompt_template="Start.", transitions={"NEXT": "When ready"})
+        async def start_state(fsm, response, will_transition):
+            return response
+
+        @fsm.define_state(state_key="NEXT", prompt_template="Next.")
+        async def next_state(fsm, response, will_transition):
+            return response
+
+        return fsm
+
+    async def test_record_turn_moves_without_llm(self):
+        fsm = self.make_fsm()
+        client, completions = make_client()
+        await fsm.run_state_machine(client, user_input="first")
+
+        run = fsm.record_turn("skip", "Skipped ahead.", "NEXT")
+
+        self.assertEqual(len(completions.calls), 1)
+        self.assertEqual(run.state, "NEXT")
+        self.assertEqual(fsm.get_curr_state(), "NEXT")
+        self.assertIsNone(fsm.get_next_state())
+        self.assertEqual(run.response, "Skipped ahead.")
+        turn = [{"role": "user", "content": "skip"}, {"role": "assistant", "content": "Skipped ahead."}]
+        self.assertEqual(run.chat_history[-2:], turn)
+        self.assertEqual(len(run.chat_history), 4)
+        self.assertEqual(fsm.get_full_session_history()[-2:], turn)
+
+        # The recorded turn is part of the history sent on the next LLM call
+        await fsm.run_state_machine(client, user_input="again")
+        self.assertEqual(completions.calls[-1][-3:-1], turn)
+
+    def test_record_turn_rejects_unknown_state(self):
+        fsm = self.make_fsm()
+        with self.assertRaises(FSMError):
+            fsm.record_turn("skip", "Skipped ahead.", "MISSING")
+        self.assertEqual(fsm.get_curr_state(), "START")
+        self.assertEqual(fsm.get_full_session_history(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from types import SimpleNamespace
+from typing import get_args
+
+from fsm_llm import LLMStateMachine
+from fsm_llm.state_models import DefaultResponse
+
+
+class FakeStream:
+    """Stands in for the streaming context manager, yielding one delta event per partial response."""
+
+    def __init__(self, partials, completion):
+        self.partials = partials
+        self.completion = completion
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        yield SimpleNamespace(type="chunk", parsed=None)
+        for partial in self.partials:
+            yield SimpleNamespace(type="content.delta", parsed=partial)
+
+    async def get_final_completion(self):
+        return self.completion
+
+
+class FakeCompletions:
+    """Stands in for `client.beta.chat.completions`, recording the messages it is sent."""
+
+    def __init__(self):
+        self.calls = []
+        self.partials = []
+
+    def completion(self, response_format):
+        # The first allowed next_state_key is the current state, so the fake always stays put
+        current_state = get_args(response_format.model_fields["next_state_key"].annotation)[0]
+        parsed = response_format(response={"content": "ok"}, next_state_key=current_state)
+        message = SimpleNamespace(parsed=parsed, refusal=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    async def parse(self, model, messages, response_format):
+        self.calls.append(messages)
+        return self.completion(response_format)
+
+    def stream(self, model, messages, response_format):
+        self.calls.append(messages)
+        return FakeStream(self.partials, self.completion(response_format))
+
+
+def make_client():
+    completions = FakeCompletions()
+    client = SimpleNamespace(beta=SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    return client, completions
+
+
+class PromptTemplateTest(unittest.IsolatedAsyncioTestCase):
+    async def run_turn(self, prompt_template, context=None):
+        fsm = LLMStateMachine(initial_state="START")
+
+        @fsm.define_state(state_key="START", prompt_template=prompt_template)
+        async def start_state(fsm, response, will_transition):
+            return response
+
+        fsm.set_context_data_dict(context or {})
+        client, completions = make_client()
+        await fsm.run_state_machine(client, user_input="hi")
+        return completions.calls[-1][0]["content"]
+
+    async def test_string_template_renders_context(self):
+        prompt = await self.run_turn("Hello {{ name }}", {"name": "bob"})
+        self.assertTrue(prompt.startswith("Hello bob\n"))
+
+    async def test_lazy_prompt_is_not_rendered(self):
+        user_data = "{{ a }} {% if %} {{ ''.__class__.__mro__[1].__subclasses__()|length }}"
+        prompt = await self.run_turn(lambda fsm: f"Notes: {fsm.get_context_data('notes')}", {"notes": user_data})
+        self.assertTrue(prompt.startswith(f"Notes: {user_data}\n"))
+
+
+class StreamingTest(unittest.IsolatedAsyncioTestCase):
+    async def test_partial_responses_reach_callback(self):
+        fsm = LLMStateMachine(initial_state="START")
+        partials_seen = []
+
+        @fsm.define_state(
+            state_key="START",
+            prompt_template="Hello",
+            response_model=DefaultResponse,
+            on_partial_response=lambda partial, fsm: partials_seen.append(partial),
+        )
+        async def start_state(fsm, response, will_transition):
+            return f"{type(response).__name__}: {response.content}"
+
+        client, completions = make_client()
+        completions.partials = [{"response": {"content": "o"}}, {"response": {"content": "ok"}}]
+        run = await fsm.run_state_machine(client, user_input="hi")
+
+        self.assertEqual(partials_seen, completions.partials)
+        self.assertEqual(len(completions.calls), 1)
+        self.assertEqual(run.response, "DefaultResponse: ok")
+
+
+if __name__ == "__main__":
+    unittest.main()
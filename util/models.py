@@ -1,3 +1,15 @@
+"""Lists the OpenAI model IDs available to the configured account.
+
+Usage: python util/models.py
+
+The list is cached on disk per API key and organization for `ttl` seconds (a day by default),
+so repeated runs skip the API round-trip.
+"""
+import hashlib
+import json
+import sys
+import time
+from functools import lru_cache
 import openai
 from dotenv import load_dotenv
 import os
@@ -7,8 +19,36 @@ load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 openai.organization = os.getenv("OPENAI_ORGANIZATION")
 
-client = openai.OpenAI()
-models_page = client.models.list()
+# Model IDs are cached here so repeated runs skip the API round-trip
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "llm_fsm")
+
+def cache_file():
+    """Cache path for the current credentials, so switching key or organization never reuses another account's list."""
+    account = f"{openai.api_key or ''}:{openai.organization or ''}"
+    digest = hashlib.sha256(account.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"models-{digest}.json")
+
+@lru_cache(maxsize=1)
+def get_client():
+    """Creates the OpenAI client on first use, so importing this module does no network or SSL setup."""
+    return openai.OpenAI()
+
+def list_models(ttl=86400):
+    """Returns the available model IDs, reusing the on-disk cache if it is younger than `ttl` seconds."""
+    path = cache_file()
+    try:
+        if time.time() - os.path.getmtime(path) < ttl:
+            with open(path, "r", encoding="utf-8") as file:
+                return json.load(file)
+    except (OSError, json.JSONDecodeError):
+        pass  # Missing or unreadable cache, fetch a fresh list
+
+    model_ids = [model.id for model in get_client().models.list()]
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(model_ids, file)
+    return model_ids
 
-for model in models_page:
-    print(model.id)
+if __name__ == "__main__":
+    # One write for the whole list instead of a print per model
+    sys.stdout.write("\n".join(list_models()) + "\n")